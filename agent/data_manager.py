@@ -1,27 +1,121 @@
 # agent/data_manager.py
+import atexit
+import codecs
+import heapq
 import logging
+import queue
 import threading
 import csv
+import operator
 import os
-from typing import Dict, Any, List, Optional
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import IO, Dict, Any, Iterable, Iterator, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+SHARD_COUNT = 16 # Leads are partitioned by lead_id so unrelated updates don't contend
+_STOP_WRITER = object() # Sentinel telling the writer thread to exit
+JOURNAL_COMPACT_ROWS = 1000 # Fold the journal into the base CSV once it holds this many rows...
+JOURNAL_COMPACT_INTERVAL_SECONDS = 60 # ...or once it has been pending this long
+TERMINAL_STATUSES = frozenset({
+    'secured', 'no_response', 'declined_final',
+    'completed', 'initiated', 'terminated'
+})
+
+def ts_to_epoch(ts: str) -> Optional[float]:
+    """Parses an ISO timestamp (naive means UTC) into epoch seconds; None if it can't be parsed."""
+    try:
+        dt = datetime.fromisoformat(ts)
+    except ValueError:
+        logger.warning(f"Could not parse timestamp '{ts}'")
+        return None
+    return (dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).timestamp()
+
+class ReadWriteLock:
+    """Lets any number of readers hold the lock together; writers get exclusive access.
+
+    Waiting writers block new readers, so a steady stream of reads can't starve updates.
+    Not re-entrant.
+    """
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer_active = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read_lock(self):
+        with self._cond:
+            while self._writer_active or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write_lock(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer_active or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer_active = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer_active = False
+                self._cond.notify_all()
+
 class DataManager:
     """Handles thread-safe reading and writing to the leads CSV file."""
     def __init__(self, filename="leads.csv"):
-        # ... (keep __init__, _initialize_csv, _read_all, _write_all - unchanged) ...
         self.filename = filename
-        self.lock = threading.Lock()
+        # Changed rows are appended here and periodically compacted into the base CSV.
+        root, ext = os.path.splitext(filename)
+        self.journal_filename = f"{root}.journal{ext or '.csv'}"
         self.fieldnames = [
             'lead_id', 'name', 'age', 'country', 'interest', 'status',
             'last_agent_msg_ts', 'follow_up_sent_flag'
         ]
+        self._row_values = operator.itemgetter(*self.fieldnames) # row dict -> values tuple in column order, in C
+        # In-memory copy of the CSV keyed by lead_id, split into shards that each
+        # have their own lock; the file is only parsed once.
+        self._shards: List[Dict[str, Dict[str, str]]] = [{} for _ in range(SHARD_COUNT)]
+        self._shard_locks: List[ReadWriteLock] = [ReadWriteLock() for _ in range(SHARD_COUNT)]
+        # Per-shard subset of leads the follow-up checker cares about, kept in step with the rows.
+        self._active_shards: List[Dict[str, Dict[str, str]]] = [{} for _ in range(SHARD_COUNT)]
+        # Min-heap of (last_agent_msg epoch, lead_id, ts string), pushed whenever an active
+        # lead's timestamp changes. Only the entry matching _live_deadlines is current; stale
+        # ones are skipped lazily and the heap is rebuilt once they outnumber the live ones.
+        self._deadlines: List[Tuple[float, str, str]] = []
+        self._live_deadlines: Dict[str, Tuple[float, str]] = {} # lead_id -> (epoch, ts)
+        self._deadlines_lock = threading.Lock() # Only ever taken after a shard lock, never before
+        self.followup_wakeup = threading.Event() # Set when a new timestamp may move the next deadline
+        self._file_lock = threading.Lock() # Serializes access to the CSV and journal files
+        self._journal_rows = 0
+        self._last_compaction = time.monotonic()
         self._initialize_csv()
-        logger.info(f"DataManager initialized for file: {self.filename}")
+        self._load_index()
+        # Updates only touch memory; this thread appends the changed rows to the journal.
+        self._write_queue: "queue.Queue[Any]" = queue.Queue()
+        self._writer_thread = threading.Thread(target=self._writer_loop, name="DataManagerWriter", daemon=True)
+        self._writer_thread.start()
+        atexit.register(self.close)
+        logger.info(f"DataManager initialized for file: {self.filename} ({sum(map(len, self._shards))} leads)")
+
+    def _shard_for(self, lead_id: str) -> int:
+        return hash(lead_id) % SHARD_COUNT
 
     def _initialize_csv(self):
-        with self.lock:
+        with self._file_lock:
             file_exists = os.path.exists(self.filename)
             is_empty = file_exists and os.path.getsize(self.filename) == 0
             if not file_exists or is_empty:
@@ -32,93 +126,326 @@ class DataManager:
                     logger.info(f"Initialized CSV file: {self.filename}")
                 except IOError as e:
                     logger.error(f"Error initializing CSV file {self.filename}: {e}", exc_info=True)
+            else:
+                self._strip_bom()
 
-    def _read_all(self) -> List[Dict[str, str]]:
-        rows = []
-        if not os.path.exists(self.filename): return rows
+    def _strip_bom(self):
+        """Removes a UTF-8 BOM (e.g. from a spreadsheet export) once, so reads can use plain utf-8."""
         try:
-            with open(self.filename, 'r', newline='', encoding='utf-8-sig') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    complete_row = {field: row.get(field, '') for field in self.fieldnames}
-                    rows.append(complete_row)
+            with open(self.filename, 'rb') as csvfile:
+                if csvfile.read(len(codecs.BOM_UTF8)) != codecs.BOM_UTF8:
+                    return
+                content = csvfile.read()
+            tmp_filename = self.filename + '.tmp'
+            with open(tmp_filename, 'wb') as csvfile:
+                csvfile.write(content)
+            os.replace(tmp_filename, self.filename)
+            logger.info(f"Removed UTF-8 BOM from {self.filename}")
+        except IOError as e:
+            logger.error(f"Error removing BOM from CSV file {self.filename}: {e}", exc_info=True)
+
+    def _load_index(self):
+        journal_count = 0
+        with self._file_lock:
+            # Stream straight into the shards without building a row list first.
+            # Journal rows are full rows written after the base file, so the last one per lead wins.
+            for row in self._iter_rows():
+                self._index_loaded_row(row)
+            for row in self._iter_journal():
+                self._index_loaded_row(row)
+                journal_count += 1
+        if journal_count:
+            logger.info(f"Replayed {journal_count} journal rows from {self.journal_filename}.")
+            self._compact()
+
+    def _index_loaded_row(self, row: Dict[str, str]):
+        shard = self._shard_for(row['lead_id'])
+        self._shards[shard][row['lead_id']] = row
+        self._refresh_active(shard, row)
+
+    def _rows_from_lists(self, reader: Iterator[List[str]], columns: List[int]) -> Iterator[Dict[str, str]]:
+        """Builds index rows from positional csv.reader rows; columns[i] is the position of fieldnames[i], or -1 if absent."""
+        fieldnames = self.fieldnames
+        for values in reader:
+            width = len(values)
+            row = {field: values[col] if 0 <= col < width else '' for field, col in zip(fieldnames, columns)}
+            if row['lead_id']:
+                yield row
+
+    def _iter_rows(self) -> Iterator[Dict[str, str]]:
+        """Yields complete rows from the base CSV one at a time."""
+        if not os.path.exists(self.filename): return
+        try:
+            with open(self.filename, 'r', newline='', encoding='utf-8', buffering=1 << 20) as csvfile:
+                reader = csv.reader(csvfile)
+                header = next(reader, None)
+                if header is None: return
+                # Map columns by header name once, so a reordered or partial header still loads
+                positions = {name: i for i, name in enumerate(header)}
+                yield from self._rows_from_lists(reader, [positions.get(field, -1) for field in self.fieldnames])
         except Exception as e:
              logger.error(f"Error reading CSV file {self.filename}: {e}", exc_info=True)
-             return []
-        return rows
 
-    def _write_all(self, data: List[Dict[str, Any]]):
+    def _iter_journal(self) -> Iterator[Dict[str, str]]:
+        """Yields complete rows from the (header-less) journal one at a time."""
+        if not os.path.exists(self.journal_filename): return
+        try:
+            with open(self.journal_filename, 'r', newline='', encoding='utf-8', buffering=1 << 20) as journal:
+                # Journal rows are always written in fieldnames order with every field, so a
+                # shorter or longer row is a partial append from a crash; padding it would blank fields.
+                fieldnames = self.fieldnames
+                for values in csv.reader(journal):
+                    if len(values) != len(fieldnames):
+                        if values: logger.warning(f"Skipping incomplete journal row in {self.journal_filename}: {values}")
+                        continue
+                    if values[0]:
+                        yield dict(zip(fieldnames, values))
+        except Exception as e:
+             logger.error(f"Error reading journal file {self.journal_filename}: {e}", exc_info=True)
+
+    def _row_values_iter(self, rows: Iterable[Dict[str, str]]) -> Iterator[Tuple[str, ...]]:
+        """Orders row values by fieldnames for csv.writer, skipping DictWriter's per-row key checks."""
+        return map(self._row_values, rows)
+
+    # --- File format hooks; subclasses storing another format override only these ---
+    def _open_for_write(self, path: str, mode: str) -> IO:
+        """Opens the base file ('w') or the journal ('a') for writing."""
+        return open(path, mode, newline='', encoding='utf-8', buffering=1 << 20)
+
+    def _write_header(self, out: IO):
+        csv.writer(out).writerow(self.fieldnames)
+
+    def _encode_rows(self, out: IO, rows: Iterable[Dict[str, str]]):
+        # Index rows always hold every field as a string, so no per-cell conversion is needed.
+        csv.writer(out).writerows(self._row_values_iter(rows))
+
+    def _write_all(self, data: Iterable[Dict[str, str]]) -> bool:
+        # Write a temp file and swap it in, so a crash mid-write never leaves a truncated file.
+        tmp_filename = self.filename + '.tmp'
         try:
-            with open(self.filename, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=self.fieldnames, extrasaction='ignore')
-                writer.writeheader()
-                sanitized_data = []
-                for row_data in data:
-                     sanitized_row = {field: str(row_data.get(field, '')) for field in self.fieldnames}
-                     sanitized_data.append(sanitized_row)
-                writer.writerows(sanitized_data)
+            with self._open_for_write(tmp_filename, 'w') as out:
+                self._write_header(out)
+                self._encode_rows(out, data)
+            os.replace(tmp_filename, self.filename)
+            return True
         except IOError as e:
             logger.error(f"Error writing to CSV file {self.filename}: {e}", exc_info=True)
+            return False
 
-    def update_lead(self, lead_data: Dict[str, Any]):
-        # ... (keep update_lead method - unchanged) ...
+    def _snapshot_rows(self, lead_ids: Optional[Iterable[str]] = None) -> List[Dict[str, str]]:
+        """Copies the given rows (all rows if None), read-locking one shard at a time.
+
+        A full snapshot is sorted so the file order is stable.
+        """
+        rows = []
+        if lead_ids is None:
+            for shard, shard_lock in zip(self._shards, self._shard_locks):
+                with shard_lock.read_lock():
+                    rows.extend(dict(row) for row in shard.values())
+            rows.sort(key=lambda row: row['lead_id'])
+            return rows
+        for lead_id in lead_ids:
+            shard = self._shard_for(lead_id)
+            with self._shard_locks[shard].read_lock():
+                row = self._shards[shard].get(lead_id)
+                if row is not None: rows.append(dict(row))
+        return rows
+
+    def _append_journal(self, lead_ids: Iterable[str]):
+        # Snapshot inside the file lock so journal rows are always appended in update order.
+        with self._file_lock:
+            rows = self._snapshot_rows(dict.fromkeys(lead_ids))
+            try:
+                with self._open_for_write(self.journal_filename, 'a') as journal:
+                    self._encode_rows(journal, rows)
+                self._journal_rows += len(rows)
+            except IOError as e:
+                logger.error(f"Error appending to journal file {self.journal_filename}: {e}", exc_info=True)
+
+    def _compact(self):
+        """Rewrites the base CSV from memory and empties the journal."""
+        with self._file_lock:
+            if not self._write_all(self._snapshot_rows()):
+                return # Keep the journal; it still holds the changes
+            try:
+                open(self.journal_filename, 'w').close()
+            except IOError as e:
+                logger.error(f"Error truncating journal file {self.journal_filename}: {e}", exc_info=True)
+            self._journal_rows = 0
+            self._last_compaction = time.monotonic()
+        logger.debug("Compacted journal into %s.", self.filename)
+
+    def _compaction_due(self) -> bool:
+        return self._journal_rows >= JOURNAL_COMPACT_ROWS or (
+            self._journal_rows > 0
+            and time.monotonic() - self._last_compaction >= JOURNAL_COMPACT_INTERVAL_SECONDS
+        )
+
+    def _writer_loop(self):
+        stop = False
+        while not stop:
+            try:
+                items = [self._write_queue.get(timeout=JOURNAL_COMPACT_INTERVAL_SECONDS)]
+            except queue.Empty:
+                items = [] # Idle: just check whether the journal is due for compaction
+            while True: # Drain everything queued so far into a single append
+                try: items.append(self._write_queue.get_nowait())
+                except queue.Empty: break
+            stop = any(item is _STOP_WRITER for item in items)
+            try:
+                lead_ids = [lead_id for item in items if item is not _STOP_WRITER for lead_id in item]
+                if lead_ids:
+                    self._append_journal(lead_ids)
+                if self._compaction_due() or (stop and self._journal_rows):
+                    self._compact()
+            except Exception as e:
+                logger.error(f"Error in CSV writer thread: {e}", exc_info=True)
+            finally:
+                for _ in items: self._write_queue.task_done()
+
+    def _queue_write(self, lead_ids: List[str]):
+        if self._writer_thread.is_alive():
+            self._write_queue.put(lead_ids)
+        else: # Closed: write synchronously so the update isn't lost
+            self._append_journal(lead_ids)
+
+    def flush(self):
+        """Blocks until every update made so far has been written to disk."""
+        if self._writer_thread.is_alive():
+            self._write_queue.join()
+
+    def close(self):
+        """Writes pending updates, compacts the journal and stops the writer thread. Safe to call more than once."""
+        if self._writer_thread.is_alive():
+            self._write_queue.put(_STOP_WRITER)
+            self._writer_thread.join()
+
+    def _refresh_active(self, shard: int, row: Dict[str, str]):
+        """Adds or removes a row from the follow-up set. Caller must hold the shard's write lock."""
+        lead_id = row['lead_id']
+        status = row.get('status')
+        ts = row.get('last_agent_msg_ts')
+        if status and status not in TERMINAL_STATUSES and ts:
+            previous = self._active_shards[shard].get(lead_id)
+            self._active_shards[shard][lead_id] = {
+                'lead_id': lead_id,
+                'last_agent_msg_ts': ts,
+                'follow_up_sent_flag': row.get('follow_up_sent_flag', 'False'),
+                'status': status
+            }
+            if previous is None or previous['last_agent_msg_ts'] != ts:
+                self._push_deadline(lead_id, ts)
+        elif self._active_shards[shard].pop(lead_id, None) is not None:
+            with self._deadlines_lock:
+                self._live_deadlines.pop(lead_id, None)
+
+    def _push_deadline(self, lead_id: str, ts: str):
+        epoch = ts_to_epoch(ts)
+        if epoch is None: return
+        with self._deadlines_lock:
+            self._live_deadlines[lead_id] = (epoch, ts)
+            heapq.heappush(self._deadlines, (epoch, lead_id, ts))
+            if len(self._deadlines) > 2 * len(self._live_deadlines):
+                # Bounds the heap when nothing pops it (e.g. the follow-up checker isn't running)
+                self._deadlines = [(e, lid, t) for lid, (e, t) in self._live_deadlines.items()]
+                heapq.heapify(self._deadlines)
+        self.followup_wakeup.set()
+
+    def _is_live(self, entry: Tuple[float, str, str]) -> bool:
+        """Caller must hold _deadlines_lock."""
+        epoch, lead_id, ts = entry
+        return self._live_deadlines.get(lead_id) == (epoch, ts)
+
+    def next_followup_time(self) -> Optional[float]:
+        """Epoch of the oldest pending agent message, or None if no lead is waiting on a reply."""
+        with self._deadlines_lock:
+            while self._deadlines and not self._is_live(self._deadlines[0]):
+                heapq.heappop(self._deadlines)
+            return self._deadlines[0][0] if self._deadlines else None
+
+    def pop_due_followups(self, cutoff_epoch: float) -> List[Dict[str, str]]:
+        """Removes and returns active leads whose last agent message is older than cutoff_epoch.
+
+        Leads that replied, finished, or already got a follow-up for that message are skipped.
+        """
+        with self._deadlines_lock:
+            candidates = []
+            while self._deadlines and self._deadlines[0][0] <= cutoff_epoch:
+                entry = heapq.heappop(self._deadlines)
+                if self._is_live(entry): # Also drops duplicates: the first match removes the live entry
+                    del self._live_deadlines[entry[1]]
+                    candidates.append(entry)
+        due_leads = []
+        for _, lead_id, ts in candidates:
+            shard = self._shard_for(lead_id)
+            with self._shard_locks[shard].read_lock():
+                lead = self._active_shards[shard].get(lead_id)
+                if (lead and lead['last_agent_msg_ts'] == ts
+                        and lead['follow_up_sent_flag'].lower() != 'true'):
+                    due_leads.append(dict(lead))
+        return due_leads
+
+    def requeue_followups(self, leads: Iterable[Dict[str, str]]):
+        """Puts leads returned by pop_due_followups back on the heap, e.g. after their update failed."""
+        for lead in leads:
+            self._push_deadline(lead['lead_id'], lead['last_agent_msg_ts'])
+
+    def _apply_update(self, lead_data: Dict[str, Any]) -> Optional[str]:
+        """Merges one update into its shard. Returns the lead_id, or None if the update was rejected or changed nothing."""
         lead_data_str = {k: str(v) if v is not None else '' for k, v in lead_data.items()}
-        with self.lock:
-            rows = self._read_all()
-            lead_id_to_update = lead_data_str.get('lead_id')
-            if not lead_id_to_update:
-                 logger.error("CSV Update Error: lead_id missing in data.")
-                 return
-            updated = False
-            update_values = {field: lead_data_str.get(field) for field in self.fieldnames if field in lead_data_str}
-            for i, row in enumerate(rows):
-                if row.get('lead_id') == str(lead_id_to_update):
-                    rows[i] = {**row, **update_values}
-                    updated = True
-                    break
-            if not updated:
-                new_row = {field: update_values.get(field, '') for field in self.fieldnames}
-                new_row['lead_id'] = str(lead_id_to_update)
-                rows.append(new_row)
+        lead_id_to_update = lead_data_str.get('lead_id')
+        if not lead_id_to_update:
+             logger.error("CSV Update Error: lead_id missing in data.")
+             return None
+        update_values = {field: lead_data_str.get(field) for field in self.fieldnames if field in lead_data_str}
+        shard = self._shard_for(lead_id_to_update)
+        with self._shard_locks[shard].write_lock():
+            row = self._shards[shard].get(lead_id_to_update)
+            if row is not None:
+                if all(row[field] == value for field, value in update_values.items()):
+                    return None # No-op (e.g. a retry turn): nothing to re-index or journal
+                row.update(update_values)
+            else:
+                row = {field: update_values.get(field, '') for field in self.fieldnames}
+                row['lead_id'] = lead_id_to_update
+                self._shards[shard][lead_id_to_update] = row
                 logger.info(f"Adding new lead {lead_id_to_update} to CSV.")
-            self._write_all(rows)
-            logger.debug(f"CSV updated for lead_id: {lead_id_to_update}")
+            self._refresh_active(shard, row)
+        return lead_id_to_update
+
+    def update_lead(self, lead_data: Dict[str, Any]):
+        lead_id = self._apply_update(lead_data)
+        if lead_id is None:
+            return
+        self._queue_write([lead_id])
+        logger.debug("Lead %s updated; journal write queued.", lead_id)
+
+    def update_leads_bulk(self, updates: List[Dict[str, Any]]):
+        """Applies several lead updates with a single CSV write."""
+        applied = [lead_id for lead_id in map(self._apply_update, updates) if lead_id is not None]
+        if not applied:
+            return
+        self._queue_write(applied)
+        logger.debug("%d leads updated; one journal write queued.", len(applied))
 
     # --- ADD THIS METHOD BACK ---
     def get_lead(self, lead_id: str) -> Optional[Dict[str, Any]]:
          """Gets a specific lead's data from CSV."""
          # Ensure comparison is string-based
          lead_id_str = str(lead_id)
-         with self.lock:
-            rows = self._read_all()
-            for row in rows:
-                if row.get('lead_id') == lead_id_str:
-                    # Return the dictionary representing the row
-                    return row
-            # Return None if lead_id not found
-            return None
+         shard = self._shard_for(lead_id_str)
+         with self._shard_locks[shard].read_lock():
+            row = self._shards[shard].get(lead_id_str)
+            # Return a copy so callers can't mutate the cached row; None if not found
+            return dict(row) if row is not None else None
     # --- END ADDED METHOD ---
 
     def get_all_active_leads_for_followup(self) -> List[Dict[str, str]]:
-         # ... (keep get_all_active_leads_for_followup method - unchanged) ...
+         """Returns leads with a non-terminal status and a pending agent timestamp."""
          active_leads = []
-         terminal_or_completed_statuses = [
-             'secured', 'no_response', 'declined_final',
-             'completed', 'initiated', 'terminated'
-         ]
-         with self.lock:
-             rows = self._read_all()
-             for row in rows:
-                 current_status = row.get('status')
-                 if current_status and current_status not in terminal_or_completed_statuses:
-                     if row.get('last_agent_msg_ts'):
-                         active_leads.append({
-                             'lead_id': row.get('lead_id', ''),
-                             'last_agent_msg_ts': row.get('last_agent_msg_ts'),
-                             'follow_up_sent_flag': row.get('follow_up_sent_flag', 'False'),
-                             'status': current_status
-                         })
-                     else: logger.debug(f"Skipping lead {row.get('lead_id')} for follow-up: Missing timestamp (Status: {current_status})")
-                 else: logger.debug(f"Skipping lead {row.get('lead_id')} for follow-up: Status '{current_status}' is terminal or completed.")
-         logger.debug(f"Found {len(active_leads)} leads potentially needing follow-up: {[l['lead_id'] for l in active_leads]}")
-         return active_leads
\ No newline at end of file
+         for active, shard_lock in zip(self._active_shards, self._shard_locks):
+             with shard_lock.read_lock():
+                 active_leads.extend(dict(lead) for lead in active.values())
+         if logger.isEnabledFor(logging.DEBUG):
+             logger.debug("Found %d leads potentially needing follow-up: %s", len(active_leads), [l['lead_id'] for l in active_leads])
+         return active_leads
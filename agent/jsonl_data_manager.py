@@ -0,0 +1,73 @@
+# agent/jsonl_data_manager.py
+import logging
+import os
+from typing import IO, Dict, Iterable, Iterator
+
+try:
+    import orjson
+except ImportError: # Optional speed-up; the stdlib encoder produces the same lines
+    orjson = None
+    import json
+
+from .data_manager import DataManager
+
+logger = logging.getLogger(__name__)
+
+if orjson is not None:
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+else:
+    def _dumps(row: Dict[str, str]) -> bytes:
+        return json.dumps(row, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    _loads = json.loads
+
+
+class JsonlDataManager(DataManager):
+    """DataManager that stores one JSON object per line instead of CSV.
+
+    Indexing, sharding, the writer thread and journal compaction are inherited;
+    only the file format differs. Each line is a complete row, so appends and
+    reads skip the csv module's per-cell quoting and dict reassembly.
+    """
+    def __init__(self, filename="leads.jsonl"):
+        super().__init__(filename=filename)
+
+    def _initialize_csv(self):
+        with self._file_lock:
+            if not os.path.exists(self.filename):
+                try:
+                    open(self.filename, 'wb').close()
+                    logger.info(f"Initialized JSONL file: {self.filename}")
+                except IOError as e:
+                    logger.error(f"Error initializing JSONL file {self.filename}: {e}", exc_info=True)
+
+    def _iter_jsonl(self, filename: str) -> Iterator[Dict[str, str]]:
+        if not os.path.exists(filename): return
+        try:
+            with open(filename, 'rb', buffering=1 << 20) as jsonl:
+                for line in jsonl:
+                    if not line.strip(): continue
+                    try:
+                        row = _loads(line)
+                    except ValueError:
+                        logger.warning(f"Skipping unreadable line in {filename}")
+                        continue
+                    if row.get('lead_id'):
+                        yield {field: row.get(field) or '' for field in self.fieldnames}
+        except Exception as e:
+             logger.error(f"Error reading JSONL file {filename}: {e}", exc_info=True)
+
+    def _iter_rows(self) -> Iterator[Dict[str, str]]:
+        return self._iter_jsonl(self.filename)
+
+    def _iter_journal(self) -> Iterator[Dict[str, str]]:
+        return self._iter_jsonl(self.journal_filename)
+
+    def _open_for_write(self, path: str, mode: str) -> IO:
+        return open(path, mode + 'b', buffering=1 << 20)
+
+    def _write_header(self, out: IO):
+        pass # Every line is self-describing
+
+    def _encode_rows(self, out: IO, rows: Iterable[Dict[str, str]]):
+        out.writelines(_dumps(row) + b'\n' for row in rows)
@@ -1,14 +1,17 @@
 # agent/sales_agent_logic.py
 # Corrected: Explicitly clear timestamp/flag when user responds after declining.
 
+import atexit
+import functools
 import logging
+import queue
+import re
 import threading
 import time
 import csv
 import os
-import copy # Import the copy module
-from datetime import datetime, timedelta, timezone # Import timezone
-from typing import Dict, Any, Optional, List, TypedDict, AsyncGenerator
+from datetime import datetime, timezone # Import timezone
+from typing import Dict, Any, Optional, List, Tuple, TypedDict, AsyncGenerator, Union, Callable, NamedTuple
 from threading import Lock # Import Lock
 
 from typing_extensions import override
@@ -36,22 +39,102 @@ except ImportError:
 
 # Import DataManager from the same package
 from .data_manager import DataManager # Assuming data_manager.py is in the same directory
+from .sqlite_data_manager import SQLiteDataManager
+
+LeadStore = Union[DataManager, SQLiteDataManager] # JsonlDataManager is a DataManager subclass
 
 logger = logging.getLogger(__name__)
 
 # --- Configuration ---
 SIMULATED_24H_DELAY_SECONDS = 5 # Seconds for testing follow-up
-FOLLOW_UP_CHECK_INTERVAL_SECONDS = 5 # How often the checker runs
+FOLLOW_UP_CHECK_INTERVAL_SECONDS = 5 # Longest the checker sleeps before re-checking the next deadline
+
+_CONSENT_WORDS = frozenset({"yes", "ok", "okay", "sure", "yeah", "yep", "affirmative"})
+_WORD_RE = re.compile(r"[a-z]+")
+# Steps that leave the lead owing us a reply, so the message sent for them starts the follow-up timer
+_STEPS_THAT_ARM_FOLLOWUP = frozenset({
+    "awaiting_consent", "awaiting_age", "awaiting_country",
+    "awaiting_interest", "awaiting_followup_after_decline"
+})
+
+
+# --- Per-step handlers ---
+class StepResult(NamedTuple):
+    """Outcome of one state-machine step. None for next_step/next_status keeps the current value.
+
+    Handlers receive the stripped utterance, its lowercase form and the session id.
+    """
+    next_step: Optional[str]
+    next_status: Optional[str]
+    message: Optional[str]
+    final_goodbye: Optional[str] = None
+    terminate: bool = False
+    field_updates: Optional[Dict[str, Any]] = None # Applied to the turn's state (and lead row for age/country/interest)
+
+def _handle_consent(utterance: str, response_lower: str, session_id: str) -> StepResult:
+    if not _CONSENT_WORDS.isdisjoint(_WORD_RE.findall(response_lower)):
+        return StepResult("awaiting_age", "awaiting_age", "Great! What is your age?")
+    # Decline Consent: stays active; the step is in _STEPS_THAT_ARM_FOLLOWUP so the timer starts below
+    return StepResult("awaiting_followup_after_decline", "awaiting_followup_after_decline", "Alright, no problem. Have a great day!")
+
+def _handle_age(utterance: str, response_lower: str, session_id: str) -> StepResult:
+    if response_lower.isdigit() and 0 < int(response_lower) < 120:
+        return StepResult("awaiting_country", "awaiting_country", "Got it. Which country are you from?", field_updates={"age": response_lower})
+    return StepResult(None, None, "Sorry... provide age as a number (e.g., 30)?")
+
+def _handle_country(utterance: str, response_lower: str, session_id: str) -> StepResult:
+    if utterance:
+        return StepResult("awaiting_interest", "awaiting_interest", "Thanks! What product or service are you interested in?",
+                          field_updates={"country": utterance})
+    return StepResult(None, None, "Could you please let me know which country you are from?")
+
+def _handle_interest(utterance: str, response_lower: str, session_id: str) -> StepResult:
+    if utterance:
+        return StepResult("completed", "secured", "Excellent, thank you for the information! We'll be in touch.",
+                          final_goodbye="Ok, goodbye!", terminate=True, field_updates={"interest": utterance})
+    return StepResult(None, None, "Could you please tell me what product or service... interested in?")
+
+def _handle_followup_after_decline(utterance: str, response_lower: str, session_id: str) -> StepResult:
+    logger.info(f"User responded after declining consent ({session_id}). Terminating.")
+    # Explicitly clear timestamp/flag for delta (the reply-clears-timer path skips this step)
+    return StepResult("declined_final", "declined_final", "Ok, goodbye!", terminate=True,
+                      field_updates={"last_agent_msg_ts": None, "follow_up_sent": False})
+
+def _handle_finished(utterance: str, response_lower: str, session_id: str) -> StepResult:
+    logger.info(f"Conversation {session_id} already finished...")
+    return StepResult(None, None, None, terminate=True)
+
+def _default_handler(utterance: str, response_lower: str, session_id: str) -> StepResult:
+    logger.warning(f"Turn for session {session_id} in unexpected state...")
+    return StepResult(None, None, "Sorry, I seem to have gotten confused...")
+
+_STEP_HANDLERS: Dict[str, Callable[[str, str, str], StepResult]] = {
+    "awaiting_consent": _handle_consent,
+    "awaiting_age": _handle_age,
+    "awaiting_country": _handle_country,
+    "awaiting_interest": _handle_interest,
+    "awaiting_followup_after_decline": _handle_followup_after_decline,
+    **dict.fromkeys(("completed", "declined", "no_response", "declined_final", "terminated"), _handle_finished),
+}
+_LEAD_DETAIL_FIELDS = ("age", "country", "interest") # Step field updates that also go straight to the lead row
+
+@functools.lru_cache(maxsize=64)
+def _model_content(text: str) -> genai_types.Content:
+    """Agent message Content, shared between events for the same text (the step messages are fixed strings).
+
+    Events only read their content, so sharing is safe; EventActions are still built per event.
+    """
+    return genai_types.Content(role='model', parts=[genai_types.Part(text=text)])
 
 
 # --- Custom Sales Agent ---
 class SalesFlowAgent(BaseAgent):
     """Orchestrates the sales lead conversation flow."""
 
-    data_manager: DataManager
+    data_manager: LeadStore
     model_config = {"arbitrary_types_allowed": True}
 
-    def __init__(self, name: str, data_manager: DataManager):
+    def __init__(self, name: str, data_manager: LeadStore):
         """Initializes the SalesFlowAgent."""
         # Pass data_manager to super for Pydantic validation
         super().__init__(
@@ -72,7 +155,7 @@ class SalesFlowAgent(BaseAgent):
         logger.info(f"--- Agent Turn Start: Session {session_id}, Agent: {agent_name} ---")
 
         state_obj_or_dict = ctx.session.state
-        is_custom_state_obj = hasattr(state_obj_or_dict, '_value') and hasattr(state_obj_or_dict, '_delta')
+        is_custom_state_obj = isinstance(state_obj_or_dict, State) # One type check instead of two attribute probes
 
         user_utterance = ""
         if ctx.session.events:
@@ -81,9 +164,9 @@ class SalesFlowAgent(BaseAgent):
                  user_utterance = last_event.content.parts[0].text
 
         # Logging Initial State
-        if is_custom_state_obj: logger.info(f"State object at start: {state_obj_or_dict.to_dict()}")
-        else: logger.info(f"Initial state dict at start: {state_obj_or_dict}")
-        logger.info(f"User utterance: '{user_utterance}'")
+        if is_custom_state_obj: logger.debug("State object at start: %s", state_obj_or_dict.to_dict())
+        else: logger.debug("Initial state dict at start: %s", state_obj_or_dict)
+        logger.debug("User utterance: '%s'", user_utterance)
 
         updated_csv_data = {"lead_id": session_id}
         message_to_send = None
@@ -93,8 +176,11 @@ class SalesFlowAgent(BaseAgent):
         timestamp_now_iso = timestamp_now.isoformat()
         state_changes: Dict[str, Any] = {}
 
-        # Use a local dictionary copy for state manipulation
-        current_turn_state = copy.deepcopy(state_obj_or_dict.to_dict() if is_custom_state_obj else state_obj_or_dict)
+        # Use a local dictionary copy for state manipulation (values are flat primitives, so shallow is enough)
+        current_turn_state = dict(state_obj_or_dict.to_dict() if is_custom_state_obj else state_obj_or_dict)
+        # Step and status live in locals for the rest of the turn; changes go straight into state_changes
+        current_step = current_turn_state.get("current_step", "initial")
+        status = current_turn_state.get("status")
 
         # --- Handle New Conversation ---
         if "current_step" not in current_turn_state:
@@ -109,6 +195,7 @@ class SalesFlowAgent(BaseAgent):
                 "last_agent_msg_ts": timestamp_now_iso, "follow_up_sent": False
             }
             current_turn_state.update(state_changes)
+            current_step = status = "awaiting_consent"
 
             self.data_manager.update_lead({
                 "lead_id": session_id, "name": lead_name, "status": "awaiting_consent",
@@ -118,7 +205,6 @@ class SalesFlowAgent(BaseAgent):
 
         # --- Handle Existing Conversation ---
         else:
-            current_step = current_turn_state.get("current_step", "initial")
             logger.info(f"Existing session {session_id}. Step: {current_step}")
 
             # Clear timer/flag in local state copy and track if user responded
@@ -128,208 +214,170 @@ class SalesFlowAgent(BaseAgent):
                 current_turn_state['last_agent_msg_ts'] = None; state_changes['last_agent_msg_ts'] = None
                 current_turn_state['follow_up_sent'] = False; state_changes['follow_up_sent'] = False
 
-            response_lower = user_utterance.lower().strip()
-            next_step = current_step
-            next_status = current_turn_state.get('status')
+            utt_stripped = user_utterance.strip()
+            response_lower = utt_stripped.lower()
 
             # --- State Machine Logic ---
-            if current_step == "awaiting_consent":
-                if any(consent in response_lower for consent in ["yes", "ok", "okay", "sure", "yeah", "yep", "affirmative"]):
-                    next_step = "awaiting_age"; next_status = "awaiting_age"
-                    message_to_send = "Great! What is your age?"
-                else: # Decline Consent
-                    next_step = "awaiting_followup_after_decline"
-                    next_status = "awaiting_followup_after_decline"
-                    message_to_send = "Alright, no problem. Have a great day!"
-                    current_turn_state['last_agent_msg_ts'] = timestamp_now_iso
-                    state_changes['last_agent_msg_ts'] = timestamp_now_iso
-                    current_turn_state['follow_up_sent'] = False # Ensure flag is false initially
-                    state_changes['follow_up_sent'] = False
-                    terminate_conversation = False # Keep active
-            elif current_step == "awaiting_age":
-                 if response_lower.isdigit() and 0 < int(response_lower) < 120:
-                     current_turn_state['age'] = response_lower; state_changes['age'] = response_lower
-                     updated_csv_data["age"] = response_lower
-                     next_step = "awaiting_country"; next_status = "awaiting_country"
-                     message_to_send = "Got it. Which country are you from?"
-                 else: message_to_send = "Sorry... provide age as a number (e.g., 30)?"
-            elif current_step == "awaiting_country":
-                 if user_utterance.strip():
-                     current_turn_state['country'] = user_utterance.strip(); state_changes['country'] = user_utterance.strip()
-                     updated_csv_data["country"] = user_utterance.strip()
-                     next_step = "awaiting_interest"; next_status = "awaiting_interest"
-                     message_to_send = "Thanks! What product or service are you interested in?"
-                 else: message_to_send = "Could you please let me know which country you are from?"
-            elif current_step == "awaiting_interest":
-                 if user_utterance.strip():
-                     current_turn_state['interest'] = user_utterance.strip(); state_changes['interest'] = user_utterance.strip()
-                     updated_csv_data["interest"] = user_utterance.strip()
-                     next_step = "completed"; next_status = "secured"
-                     message_to_send = "Excellent, thank you for the information! We'll be in touch."
-                     final_goodbye_message = "Ok, goodbye!"
-                     terminate_conversation = True
-                 else: message_to_send = "Could you please tell me what product or service... interested in?"
-
-            # --- CORRECTED State Handling for response after decline ---
-            elif current_step == "awaiting_followup_after_decline":
-                 logger.info(f"User responded after declining consent ({session_id}). Terminating.")
-                 message_to_send = "Ok, goodbye!"
-                 next_step = "declined_final"; next_status = "declined_final"
-                 terminate_conversation = True
-                 # --- Explicitly clear timestamp/flag for delta ---
-                 current_turn_state['last_agent_msg_ts'] = None; state_changes['last_agent_msg_ts'] = None
-                 current_turn_state['follow_up_sent'] = False; state_changes['follow_up_sent'] = False
-                 # --- End Correction ---
-
-            elif current_step in ["completed", "declined", "no_response", "declined_final", "terminated"]:
-                 logger.info(f"Conversation {session_id} already finished...")
-                 message_to_send = None; terminate_conversation = True
-            else: logger.warning(f"Turn for session {session_id} in unexpected state..."); message_to_send = "Sorry, I seem to have gotten confused..."
+            handler = _STEP_HANDLERS.get(current_step, _default_handler)
+            result = handler(utt_stripped, response_lower, session_id)
+            message_to_send = result.message
+            final_goodbye_message = result.final_goodbye
+            terminate_conversation = result.terminate
+            for field, value in (result.field_updates or {}).items():
+                current_turn_state[field] = value; state_changes[field] = value
+                if field in _LEAD_DETAIL_FIELDS: updated_csv_data[field] = value
 
             # Apply step/status changes
-            if next_step != current_step: current_turn_state['current_step'] = next_step; state_changes['current_step'] = next_step
-            if next_status != current_turn_state.get('status'): current_turn_state['status'] = next_status; state_changes['status'] = next_status
+            if result.next_step and result.next_step != current_step: current_step = state_changes['current_step'] = result.next_step
+            if result.next_status and result.next_status != status: status = state_changes['status'] = result.next_status
+
+        # --- Fold termination into this turn's event (the goodbye event carries it otherwise) ---
+        if terminate_conversation and not final_goodbye_message:
+            logger.info(f"Conversation {session_id} ended without explicit goodbye. Marking terminated.")
+            current_step = state_changes["current_step"] = "terminated"
+            state_changes["status"] = status or 'terminated'
 
         # --- Send Response(s) ---
         event_actions = EventActions()
         if message_to_send:
             logger.info(f"Preparing agent response for {session_id}: '{message_to_send}'")
-            agent_content = genai_types.Content(role='model', parts=[genai_types.Part(text=message_to_send)])
+            agent_content = _model_content(message_to_send)
 
             # Update timestamp in local state and track change if needed
-            if any(q in message_to_send for q in ["okay?", "age?", "from?", "interested in?", "ready to continue."]) \
-               or current_turn_state.get('current_step') == "awaiting_followup_after_decline":
+            if current_step in _STEPS_THAT_ARM_FOLLOWUP:
                 current_turn_state['last_agent_msg_ts'] = timestamp_now_iso; state_changes['last_agent_msg_ts'] = timestamp_now_iso
                 current_turn_state['follow_up_sent'] = False; state_changes['follow_up_sent'] = False
 
             if state_changes:
-                 logger.debug(f"Attaching state delta to event (main message): {state_changes}")
-                 event_actions = EventActions(state_delta=copy.deepcopy(state_changes))
-                 # state_changes_sent = state_changes # No longer need to track separately
+                 logger.debug("Attaching state delta to event (main message): %s", state_changes)
+                 # No copy needed: state_changes is rebound below, so the event owns this dict
+                 # (ADK only reads the delta, and reassigns rather than mutates it)
+                 event_actions = EventActions(state_delta=state_changes)
                  state_changes = {} # Reset delta after preparing main event actions
 
             yield Event(author=agent_name, content=agent_content, actions=event_actions)
-
+        elif state_changes:
+            # Nothing to say (e.g. conversation already finished), but the delta still has to be persisted
+            logger.debug("Attaching state delta to actions-only event: %s", state_changes)
+            yield Event(author=agent_name, actions=EventActions(state_delta=state_changes)) # Event with no content, only actions
+            state_changes = {}
 
         # --- Send the final goodbye message ---
         if final_goodbye_message and final_goodbye_message != message_to_send:
              logger.info(f"Preparing final goodbye for {session_id}: '{final_goodbye_message}'")
-             goodbye_content = genai_types.Content(role='model', parts=[genai_types.Part(text=final_goodbye_message)])
-             final_status = current_turn_state.get('status', 'terminated')
+             goodbye_content = _model_content(final_goodbye_message)
              # Ensure final status/step are included in delta
              state_changes["current_step"] = "terminated"
-             state_changes["status"] = final_status
-             final_actions = EventActions(state_delta=copy.deepcopy(state_changes)) # Use copy
-             yield Event(author=agent_name, content=goodbye_content, actions=final_actions)
+             state_changes["status"] = status or 'terminated'
+             final_actions = EventActions(state_delta=state_changes) # Handed over, not copied; rebound below
              state_changes = {}
+             yield Event(author=agent_name, content=goodbye_content, actions=final_actions)
 
 
         # --- Update CSV ---
-        updated_csv_data["status"] = current_turn_state.get('status', 'unknown')
+        updated_csv_data["status"] = status or 'unknown'
         updated_csv_data["last_agent_msg_ts"] = current_turn_state.get('last_agent_msg_ts', '')
         updated_csv_data["follow_up_sent_flag"] = str(current_turn_state.get('follow_up_sent', False))
-        if current_turn_state.get('status') == 'secured':
+        if status == 'secured':
              updated_csv_data["age"] = current_turn_state.get('age', '')
              updated_csv_data["country"] = current_turn_state.get('country', '')
              updated_csv_data["interest"] = current_turn_state.get('interest', '')
         logger.info(f"Updating CSV for {session_id}. Status: {updated_csv_data['status']}")
         self.data_manager.update_lead(updated_csv_data)
 
-        # --- Handle Conversation Termination Event Action ---
-        if terminate_conversation and not final_goodbye_message:
-             logger.info(f"Conversation {session_id} ended without explicit goodbye. Yielding termination event.")
-             final_status = current_turn_state.get('status', 'terminated')
-             clear_state_delta = {"current_step": "terminated", "status": final_status}
-             clear_state_delta.update(state_changes) # Include any pending changes
-             clear_actions = EventActions(state_delta=clear_state_delta)
-             yield Event(author=agent_name, actions=clear_actions) # Event with no content, only actions
-             state_changes = {}
-
 
         logger.info(f"--- Agent Turn End: Session {session_id} ---")
-        if state_changes: logger.debug(f"State delta pending (unsent with message this turn): {state_changes}")
+        if state_changes: logger.debug("State delta pending (unsent with message this turn): %s", state_changes)
 
 
 # --- Follow-Up Logic (Background Thread) ---
-_follow_up_running = True
-def follow_up_checker(data_manager_instance: DataManager, pending_followups: Dict[str, str], followup_lock: Lock):
-    """Checks CSV for unresponsive leads and adds messages to pending_followups."""
-    logger.info("Follow-up checker thread started.")
-    global _follow_up_running
-    while _follow_up_running:
-        try:
-            time.sleep(FOLLOW_UP_CHECK_INTERVAL_SECONDS)
-            now = datetime.now(timezone.utc)
-            cutoff_time = now - timedelta(seconds=SIMULATED_24H_DELAY_SECONDS)
-            logger.debug(f"Running follow-up check... Cutoff Time (UTC): {cutoff_time.isoformat()}")
-
-            active_leads_for_check = data_manager_instance.get_all_active_leads_for_followup()
-
-            for lead_info in active_leads_for_check:
-                session_id = lead_info.get('lead_id')
-                ts_str = lead_info.get('last_agent_msg_ts')
-                flag_str = lead_info.get('follow_up_sent_flag', 'False')
-                current_status = lead_info.get('status')
+_shutdown = threading.Event() # Set by stop_follow_up_checker(); the checker exits at its next wake-up
+_checker_wakeup: Optional[threading.Event] = None # Wake-up event of the running checker, so stopping doesn't wait out its sleep
 
-                if not session_id or not ts_str: continue
+def stop_follow_up_checker():
+    """Signals the follow-up checker thread to exit. Registered with atexit; safe to call more than once."""
+    _shutdown.set()
+    if _checker_wakeup is not None: _checker_wakeup.set()
 
-                try:
-                    last_msg_time = datetime.fromisoformat(ts_str)
-                    if last_msg_time.tzinfo is None:
-                         last_msg_time = last_msg_time.replace(tzinfo=timezone.utc)
+atexit.register(stop_follow_up_checker)
 
-                    follow_up_sent = flag_str.lower() == 'true'
-                    time_diff = now - last_msg_time
-                    is_overdue = last_msg_time < cutoff_time
+def follow_up_checker(data_manager_instance: LeadStore, pending_followups: Dict[str, "queue.SimpleQueue[str]"]):
+    """Waits for leads to go unanswered past the delay and puts messages on the lead's queue in pending_followups.
 
-                    logger.debug(
-                        f"Checker[{session_id}]: Status={current_status}, Now={now.isoformat()}, "
-                        f"Cutoff={cutoff_time.isoformat()}, LastMsg={last_msg_time.isoformat()}, "
-                        f"Diff={time_diff.total_seconds():.1f}s, ConfigDelay={SIMULATED_24H_DELAY_SECONDS}s, "
-                        f"Flag={follow_up_sent}, Overdue={is_overdue}"
-                    )
+    Consumers take messages with pending_followups[lead_id].get_nowait(); SimpleQueue is
+    thread-safe on its own, so no lock is shared with the web process.
 
-                    if not follow_up_sent and is_overdue:
-                        logger.info(f"Follow-up condition met for {session_id} (Status: {current_status}). Preparing action.")
-
-                        final_status_after_followup = current_status
-                        terminate_after_followup = False
-                        if current_status == "awaiting_followup_after_decline":
-                             final_status_after_followup = "declined_final"
-                             terminate_after_followup = True
-
-                        followup_message = "Just checking in to see if you're still interested. Let me know when you're ready to continue."
-
-                        # --- Update CSV FIRST ---
-                        update_data = {"lead_id": session_id, "follow_up_sent_flag": 'True'}
-                        if terminate_after_followup:
-                             update_data["status"] = final_status_after_followup
-                             update_data["last_agent_msg_ts"] = ''
-
-                        try:
-                            data_manager_instance.update_lead(update_data)
-                            logger.info(f"Updated CSV for {session_id}: follow_up_sent=True, status={update_data.get('status', current_status)}")
-
-                            # --- Add message to pending queue AFTER successful CSV update ---
-                            with followup_lock:
-                                 current_flag_val = data_manager_instance.get_lead(session_id).get('follow_up_sent_flag', 'False') if data_manager_instance.get_lead(session_id) else 'False'
-                                 if current_flag_val.lower() == 'true' and session_id not in pending_followups:
-                                     pending_followups[session_id] = followup_message
-                                     logger.info(f"Added pending follow-up message for {session_id}")
-                                 else:
-                                     logger.debug(f"Follow-up for {session_id} was already pending or flag update failed.")
-
-                            logger.warning(f"PROACTIVE SEND NEEDED for {session_id}: Requires ADK function.")
-
-                        except Exception as update_err:
-                             logger.error(f"Error updating CSV during follow-up for {session_id}: {update_err}", exc_info=True)
-
-
-                except ValueError:
-                    if ts_str: logger.warning(f"Could not parse timestamp '{ts_str}' for session {session_id}")
-                except Exception as inner_err: logger.error(f"Error processing follow-up check for {session_id}: {inner_err}", exc_info=True)
-
-        except Exception as e: logger.error(f"Error in follow-up checker loop: {e}", exc_info=True); time.sleep(10)
+    Instead of scanning every lead on a fixed interval, the thread sleeps until the oldest
+    pending agent message becomes overdue; the data manager wakes it early on new timestamps.
+    """
+    logger.info("Follow-up checker thread started.")
+    global _checker_wakeup
+    wakeup = _checker_wakeup = data_manager_instance.followup_wakeup
+    while not _shutdown.is_set():
+        try:
+            wakeup.clear() # Before peeking, so a timestamp pushed after the peek still wakes us
+            next_msg_epoch = data_manager_instance.next_followup_time()
+            wait_seconds = FOLLOW_UP_CHECK_INTERVAL_SECONDS
+            if next_msg_epoch is not None:
+                wait_seconds = min(wait_seconds, next_msg_epoch + SIMULATED_24H_DELAY_SECONDS - time.time())
+            if wait_seconds > 0:
+                wakeup.wait(wait_seconds)
+            if _shutdown.is_set(): break
+
+            cutoff_epoch = time.time() - SIMULATED_24H_DELAY_SECONDS
+            due_leads = data_manager_instance.pop_due_followups(cutoff_epoch)
+            if not due_leads: continue
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Follow-up due for %s (delay %ss)", [l['lead_id'] for l in due_leads], SIMULATED_24H_DELAY_SECONDS)
+
+            batched_updates: List[Dict[str, str]] = []
+            due_followups: List[Tuple[str, str]] = []
+            for lead_info in due_leads:
+                session_id = lead_info['lead_id']
+                current_status = lead_info.get('status')
+                logger.info(f"Follow-up condition met for {session_id} (Status: {current_status}). Preparing action.")
+
+                final_status_after_followup = current_status
+                terminate_after_followup = False
+                if current_status == "awaiting_followup_after_decline":
+                     final_status_after_followup = "declined_final"
+                     terminate_after_followup = True
+
+                followup_message = "Just checking in to see if you're still interested. Let me know when you're ready to continue."
+
+                # --- Queue CSV update; all overdue leads are written together below ---
+                update_data = {"lead_id": session_id, "follow_up_sent_flag": 'True'}
+                if terminate_after_followup:
+                     update_data["status"] = final_status_after_followup
+                     update_data["last_agent_msg_ts"] = ''
+                batched_updates.append(update_data)
+                due_followups.append((session_id, followup_message))
+
+            # --- Update CSV FIRST (one write per wake-up) ---
+            try:
+                data_manager_instance.update_leads_bulk(batched_updates)
+                logger.info(f"Updated CSV for {len(batched_updates)} leads: follow_up_sent=True")
+            except Exception as update_err:
+                logger.error(f"Error updating CSV during follow-up for {[u['lead_id'] for u in batched_updates]}: {update_err}", exc_info=True)
+                data_manager_instance.requeue_followups(due_leads) # Retry them on a later pass
+                _shutdown.wait(FOLLOW_UP_CHECK_INTERVAL_SECONDS) # They're already overdue, so don't spin
+                continue
+
+            # --- Add messages to pending queue AFTER successful CSV update ---
+            for session_id, followup_message in due_followups:
+                # Re-check the flag: a user turn between the bulk update and here clears it
+                lead = data_manager_instance.get_lead(session_id)
+                current_flag_val = lead.get('follow_up_sent_flag', 'False') if lead else 'False'
+                if current_flag_val.lower() == 'true':
+                     pending_followups.setdefault(session_id, queue.SimpleQueue()).put(followup_message)
+                     logger.info(f"Added pending follow-up message for {session_id}")
+                else:
+                     logger.debug("Follow-up for %s skipped: flag update failed or user replied.", session_id)
+
+                logger.warning(f"PROACTIVE SEND NEEDED for {session_id}: Requires ADK function.")
+
+        except Exception as e: logger.error(f"Error in follow-up checker loop: {e}", exc_info=True); _shutdown.wait(10)
+    logger.info("Follow-up checker thread stopped.")
 
 
 # --- Main Execution Block (Not run when using app.py) ---
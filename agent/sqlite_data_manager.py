@@ -0,0 +1,131 @@
+# agent/sqlite_data_manager.py
+import logging
+import sqlite3
+import threading
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from .data_manager import TERMINAL_STATUSES, ts_to_epoch
+
+logger = logging.getLogger(__name__)
+
+_TERMINAL_STATUS_PARAMS = tuple(sorted(TERMINAL_STATUSES)) # Stable order for the SQL placeholders
+
+class SQLiteDataManager:
+    """Drop-in alternative to DataManager that stores leads in an SQLite table.
+
+    Updates are single-row upserts on the lead_id primary key and the follow-up
+    scan is one indexed SELECT, so neither grows with a full-file rewrite.
+    """
+    def __init__(self, filename="leads.db"):
+        self.filename = filename
+        self.lock = threading.Lock() # One connection shared across request/checker threads
+        self.fieldnames = [
+            'lead_id', 'name', 'age', 'country', 'interest', 'status',
+            'last_agent_msg_ts', 'follow_up_sent_flag'
+        ]
+        self._conn = sqlite3.connect(self.filename, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self.followup_wakeup = threading.Event() # Set when a new timestamp may move the next deadline
+        self._initialize_db()
+        logger.info(f"SQLiteDataManager initialized for file: {self.filename}")
+
+    def _initialize_db(self):
+        columns = ", ".join(f"{field} TEXT NOT NULL DEFAULT ''" for field in self.fieldnames[1:])
+        with self.lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS leads (lead_id TEXT PRIMARY KEY, {columns})")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_status_ts ON leads(status, last_agent_msg_ts)")
+
+    def _upsert(self, lead_data: Dict[str, Any]) -> Optional[str]:
+        """Inserts or updates one lead. Caller must hold the lock. Returns the lead_id, or None if rejected."""
+        lead_data_str = {k: str(v) if v is not None else '' for k, v in lead_data.items()}
+        lead_id_to_update = lead_data_str.get('lead_id')
+        if not lead_id_to_update:
+            logger.error("DB Update Error: lead_id missing in data.")
+            return None
+        fields = [field for field in self.fieldnames if field in lead_data_str]
+        placeholders = ", ".join("?" for _ in fields)
+        assignments = ", ".join(f"{field}=excluded.{field}" for field in fields if field != 'lead_id')
+        sql = f"INSERT INTO leads ({', '.join(fields)}) VALUES ({placeholders}) ON CONFLICT(lead_id) DO "
+        if assignments:
+            # Skip the row write when every value is already current
+            changed = " OR ".join(f"{field} IS NOT excluded.{field}" for field in fields if field != 'lead_id')
+            sql += f"UPDATE SET {assignments} WHERE {changed}"
+        else:
+            sql += "NOTHING"
+        self._conn.execute(sql, [lead_data_str[field] for field in fields])
+        return lead_id_to_update
+
+    def update_lead(self, lead_data: Dict[str, Any]):
+        try:
+            with self.lock:
+                lead_id = self._upsert(lead_data)
+        except sqlite3.Error as e:
+            logger.error(f"Error updating lead in {self.filename}: {e}", exc_info=True)
+            return
+        if lead_id is not None:
+            if lead_data.get('last_agent_msg_ts'): self.followup_wakeup.set()
+            logger.debug("DB updated for lead_id: %s", lead_id)
+
+    def update_leads_bulk(self, updates: List[Dict[str, Any]]):
+        """Applies several lead updates in one transaction."""
+        if not updates: return
+        try:
+            with self.lock:
+                self._conn.execute("BEGIN")
+                try:
+                    applied = sum(1 for lead_data in updates if self._upsert(lead_data) is not None)
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            logger.error(f"Error applying bulk update to {self.filename}: {e}", exc_info=True)
+            return
+        if any(lead_data.get('last_agent_msg_ts') for lead_data in updates): self.followup_wakeup.set()
+        logger.debug("DB updated for %s leads in one transaction.", applied)
+
+    def flush(self):
+        """No-op: every update is committed before update_lead returns."""
+
+    def close(self):
+        with self.lock:
+            self._conn.close()
+
+    def get_lead(self, lead_id: str) -> Optional[Dict[str, Any]]:
+        """Gets a specific lead's data from the database."""
+        with self.lock:
+            row = self._conn.execute("SELECT * FROM leads WHERE lead_id = ?", (str(lead_id),)).fetchone()
+        return dict(row) if row is not None else None
+
+    def get_all_active_leads_for_followup(self) -> List[Dict[str, str]]:
+        placeholders = ", ".join("?" for _ in _TERMINAL_STATUS_PARAMS)
+        with self.lock:
+            rows = self._conn.execute(
+                "SELECT lead_id, last_agent_msg_ts, follow_up_sent_flag, status FROM leads "
+                f"WHERE status != '' AND status NOT IN ({placeholders}) AND last_agent_msg_ts != ''",
+                _TERMINAL_STATUS_PARAMS
+            ).fetchall()
+        active_leads = [dict(row) for row in rows]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Found %d leads potentially needing follow-up: %s", len(active_leads), [l['lead_id'] for l in active_leads])
+        return active_leads
+
+    def _pending_followups(self) -> List[Tuple[float, Dict[str, str]]]:
+        pending = []
+        for lead in self.get_all_active_leads_for_followup():
+            if lead['follow_up_sent_flag'].lower() == 'true': continue
+            epoch = ts_to_epoch(lead['last_agent_msg_ts'])
+            if epoch is not None: pending.append((epoch, lead))
+        return pending
+
+    def next_followup_time(self) -> Optional[float]:
+        """Epoch of the oldest pending agent message, or None if no lead is waiting on a reply."""
+        return min((epoch for epoch, _ in self._pending_followups()), default=None)
+
+    def pop_due_followups(self, cutoff_epoch: float) -> List[Dict[str, str]]:
+        """Returns active leads whose last agent message is older than cutoff_epoch and had no follow-up yet."""
+        return [lead for epoch, lead in self._pending_followups() if epoch <= cutoff_epoch]
+
+    def requeue_followups(self, leads: Iterable[Dict[str, str]]):
+        """No-op: pop_due_followups is a query, so unsent follow-ups are found again next time."""
@@ -2,7 +2,9 @@
 import logging
 import os
 import secrets
-from flask import Flask, render_template, request, jsonify, session as flask_session, redirect, url_for
+from collections import defaultdict, deque
+from itertools import islice
+from flask import Flask, Response, render_template, request, jsonify, session as flask_session, redirect, url_for, stream_with_context
 from threading import Lock # Import Lock for history dictionary
 
 # --- ADK/Agent Imports ---
@@ -16,24 +18,60 @@ except ImportError:
     print("ERROR: Failed to import necessary ADK/GenAI components in app.py.")
     exit(1)
 from agent.data_manager import DataManager
+from agent.sqlite_data_manager import SQLiteDataManager
+from agent.jsonl_data_manager import JsonlDataManager
 from agent.sales_agent_logic import SalesFlowAgent
 
+# --- Optional faster JSON (orjson) for responses, request bodies and stored history ---
+try:
+    import orjson
+    from flask.json.provider import JSONProvider # Flask >= 2.2
+
+    class OrjsonProvider(JSONProvider):
+        """Flask JSON provider backed by orjson."""
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            # orjson already produces bytes, so skip the str round-trip
+            return self._app.response_class(orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS), mimetype="application/json")
+except ImportError:
+    OrjsonProvider = None
+
 # --- Basic Flask App Setup ---
 app = Flask(__name__)
+if OrjsonProvider is not None:
+    app.json = OrjsonProvider(app)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", secrets.token_hex(16))
 
 # --- Logging Setup ---
-app.logger.setLevel(logging.INFO)
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - [%(name)s] %(message)s') # Set root logger to DEBUG
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper() # e.g. DEBUG while developing, WARNING in production
+_invalid_log_level = not isinstance(logging.getLevelName(LOG_LEVEL), int) # Unlike getLevelNamesMapping(), works before Python 3.11
+if _invalid_log_level: LOG_LEVEL = "INFO"
+app.logger.setLevel(LOG_LEVEL)
+logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s - %(levelname)s - [%(name)s] %(message)s')
+if _invalid_log_level: app.logger.warning("Unknown LOG_LEVEL %r, using INFO", os.environ["LOG_LEVEL"])
 
 
 # --- Global ADK/Agent Setup ---
 CSV_FILENAME = "leads.csv"
+SQLITE_FILENAME = "leads.db"
+JSONL_FILENAME = "leads.jsonl"
+LEADS_BACKEND = os.environ.get("LEADS_BACKEND", "csv").lower() # "csv", "jsonl" or "sqlite"
 APP_NAME = "sales_agent_app"
 WEB_USER_ID = "flask_user"
 
 try:
-    data_manager_main = DataManager(filename=CSV_FILENAME)
+    if LEADS_BACKEND == "sqlite":
+        data_manager_main = SQLiteDataManager(filename=SQLITE_FILENAME)
+    elif LEADS_BACKEND == "jsonl":
+        data_manager_main = JsonlDataManager(filename=JSONL_FILENAME)
+    else:
+        data_manager_main = DataManager(filename=CSV_FILENAME)
     session_service_main = InMemorySessionService()
     sales_agent_main = SalesFlowAgent(name="SalesFlowAgent", data_manager=data_manager_main)
     runner_main = Runner(
@@ -43,13 +81,120 @@ try:
     )
     app.logger.info("ADK Runner and Agent initialized successfully.")
 except Exception as e:
-    app.logger.error(f"Failed to initialize ADK components: {e}", exc_info=True)
+    app.logger.error("Failed to initialize ADK components: %s", e, exc_info=True)
     runner_main = None
 
 # --- Server-Side Chat History Storage ---
-# WARNING: This dictionary is lost if the server restarts!
-chat_histories = {}
-history_lock = Lock() # Lock for safe concurrent access to the history dict
+# With REDIS_URL set, each lead's history is a Redis list shared by all workers.
+# Otherwise it lives in this dictionary. WARNING: the dictionary is lost if the server restarts!
+REDIS_URL = os.environ.get("REDIS_URL")
+HISTORY_TTL_SECONDS = 7 * 24 * 60 * 60 # Idle Redis histories expire after a week
+redis_client = None
+if REDIS_URL:
+    try:
+        import redis
+        redis_client = redis.Redis.from_url(REDIS_URL)
+        app.logger.info("Chat history stored in Redis at %s", REDIS_URL)
+    except ImportError:
+        app.logger.warning("REDIS_URL is set but the 'redis' package is not installed. Keeping chat history in memory.")
+
+# With Redis available, keep the Flask session server-side too (cookie holds only an opaque id)
+if redis_client is not None:
+    try:
+        from flask_session import Session as ServerSideSession
+        app.config.update(SESSION_TYPE="redis", SESSION_REDIS=redis_client)
+        ServerSideSession(app)
+        app.logger.info("Flask sessions stored in Redis.")
+    except ImportError:
+        app.logger.info("Flask-Session is not installed. Keeping lead_id in the signed session cookie.")
+
+HISTORY_MAX_MESSAGES = 500 # Older messages are dropped, bounding memory per session
+# lead_id -> deque of the latest messages; indexing a new lead creates its deque, .get() does not
+chat_histories = defaultdict(lambda: deque(maxlen=HISTORY_MAX_MESSAGES))
+HISTORY_PAGE_SIZE = 50 # Messages per /history request
+# lead_id -> how many messages the deque has dropped, so /history positions stay absolute
+history_evicted = defaultdict(int)
+SESSION_LOCK_SHARDS = 32
+_history_locks = [Lock() for _ in range(SESSION_LOCK_SHARDS)] # Striped so unrelated sessions don't contend
+
+def _lock_for(lead_id):
+    """Returns the lock guarding this lead's entry in chat_histories."""
+    return _history_locks[hash(lead_id) % SESSION_LOCK_SHARDS]
+
+def _history_key(lead_id):
+    return f"hist:{lead_id}"
+
+def _history_total_key(lead_id):
+    return f"histtotal:{lead_id}" # Messages appended since the last reset, trimmed ones included
+
+def _page_bounds(total, evicted, before, limit):
+    """Clamps a page to the retained messages; returns absolute (start, end)."""
+    end = total if before is None else max(evicted, min(before, total))
+    return max(evicted, end - limit), end
+
+def get_history_page(lead_id, before=None, limit=HISTORY_PAGE_SIZE):
+    """Returns (messages, start, oldest): up to limit messages ending just before position before (the latest if None).
+
+    Positions count every message since the chat started, so they don't shift when old
+    messages are dropped. start is the position of the first returned message; pass it
+    as before to page further back. oldest is the first position still kept.
+    """
+    if redis_client is not None:
+        key, total_key = _history_key(lead_id), _history_total_key(lead_id)
+        bounds = []
+        def read_page(pipe): # Re-run by redis-py if an append lands between the reads and the slice
+            total = int(pipe.get(total_key) or 0)
+            evicted = total - pipe.llen(key)
+            start, end = _page_bounds(total, evicted, before, limit)
+            bounds[:] = start, evicted
+            pipe.multi()
+            if end > start: pipe.lrange(key, start - evicted, end - evicted - 1)
+        results = redis_client.transaction(read_page, key, total_key)
+        start, evicted = bounds
+        items = results[0] if results else []
+        return [app.json.loads(item) for item in items], start, evicted
+    with _lock_for(lead_id):
+        history = chat_histories.get(lead_id, ())
+        evicted = history_evicted.get(lead_id, 0)
+        start, end = _page_bounds(evicted + len(history), evicted, before, limit)
+        return list(islice(history, start - evicted, end - evicted)), start, evicted
+
+def append_history(lead_id, *messages):
+    if not messages: return
+    if redis_client is not None:
+        key, total_key = _history_key(lead_id), _history_total_key(lead_id)
+        pipe = redis_client.pipeline()
+        pipe.rpush(key, *(app.json.dumps(message) for message in messages))
+        pipe.incrby(total_key, len(messages))
+        pipe.ltrim(key, -HISTORY_MAX_MESSAGES, -1)
+        pipe.expire(key, HISTORY_TTL_SECONDS)
+        pipe.expire(total_key, HISTORY_TTL_SECONDS)
+        pipe.execute()
+        return
+    with _lock_for(lead_id):
+        history = chat_histories[lead_id]
+        overflow = len(history) + len(messages) - HISTORY_MAX_MESSAGES
+        if overflow > 0: history_evicted[lead_id] += overflow
+        history.extend(messages)
+
+def reset_history(lead_id, messages=()):
+    """Replaces the lead's chat history with messages."""
+    if redis_client is not None:
+        key, total_key = _history_key(lead_id), _history_total_key(lead_id)
+        pipe = redis_client.pipeline()
+        pipe.delete(key, total_key)
+        if messages:
+            pipe.rpush(key, *(app.json.dumps(message) for message in messages))
+            pipe.set(total_key, len(messages), ex=HISTORY_TTL_SECONDS)
+            pipe.ltrim(key, -HISTORY_MAX_MESSAGES, -1)
+            pipe.expire(key, HISTORY_TTL_SECONDS)
+        pipe.execute()
+        return
+    with _lock_for(lead_id):
+        history = chat_histories[lead_id]
+        history.clear() # Reuse the existing deque
+        history.extend(messages)
+        history_evicted[lead_id] = max(0, len(messages) - HISTORY_MAX_MESSAGES)
 
 # Note: Follow-up thread NOT started for web simplicity
 
@@ -69,28 +214,21 @@ def start_chat():
 
     session_id = lead_id
     flask_session['lead_id'] = lead_id # Keep lead_id associated with browser session
-    app.logger.info(f"Flask session set for lead_id: {lead_id}")
+    app.logger.info("Flask session set for lead_id: %s", lead_id)
 
     session = session_service_main.get_session(app_name=APP_NAME, user_id=WEB_USER_ID, session_id=session_id)
     initial_state = {"name": lead_name}
     if not session:
-        app.logger.info(f"Creating new ADK session: {session_id}")
+        app.logger.info("Creating new ADK session: %s", session_id)
         session = session_service_main.create_session(app_name=APP_NAME, user_id=WEB_USER_ID, session_id=session_id, state=initial_state)
         if not session: return "Error creating agent session.", 500
-        # Initialize history for new session
-        with history_lock:
-            chat_histories[session_id] = []
     else:
-        app.logger.warning(f"ADK Session {session_id} already exists. Updating name.")
-        if hasattr(session.state, 'update'): session.state.update(initial_state)
-        # Ensure history exists if session was somehow persisted without it
-        with history_lock:
-            if session_id not in chat_histories:
-                 chat_histories[session_id] = []
+        app.logger.warning("ADK Session %s already exists. Updating name.", session_id)
+        session.state.update(initial_state) # dict and ADK State both provide update()
 
 
     try:
-        app.logger.info(f"Running initial turn for session: {session_id}")
+        app.logger.info("Running initial turn for session: %s", session_id)
         events = runner_main.run(user_id=WEB_USER_ID, session_id=session_id, new_message=None)
 
         initial_messages = []
@@ -99,14 +237,13 @@ def start_chat():
                  msg_text = event.content.parts[0].text
                  initial_messages.append({"author": "Agent", "text": msg_text})
 
-        # Store initial messages in server-side dictionary
-        with history_lock:
-            # Overwrite history on trigger? Or append? Let's overwrite for simplicity on trigger.
-            chat_histories[session_id] = initial_messages
-        app.logger.info(f"Initial messages stored for {lead_id}: {initial_messages}")
+        # Store initial messages server-side
+        # Overwrite history on trigger? Or append? Let's overwrite for simplicity on trigger.
+        reset_history(session_id, initial_messages)
+        app.logger.info("Stored %s initial messages for %s", len(initial_messages), lead_id)
 
     except Exception as e:
-        app.logger.error(f"Error running initial agent turn for {session_id}: {e}", exc_info=True)
+        app.logger.error("Error running initial agent turn for %s: %s", session_id, e, exc_info=True)
         return f"Error starting conversation: {e}", 500
 
     # No longer need to store history in Flask session cookie
@@ -119,11 +256,19 @@ def chat():
     lead_id = flask_session.get('lead_id')
     if not lead_id: return redirect(url_for('index'))
 
-    # Retrieve history from server-side dictionary
-    with history_lock:
-        chat_history = chat_histories.get(lead_id, []) # Get history or empty list
+    # History is fetched by script.js from /history, so the page renders without it
+    return render_template('chat.html', lead_id=lead_id)
+
+@app.route('/history', methods=['GET'])
+def history():
+    lead_id = flask_session.get('lead_id')
+    if not lead_id: return jsonify({"error": "No active session found. Please start again."}), 400
 
-    return render_template('chat.html', lead_id=lead_id, history=chat_history)
+    before = request.args.get('before', type=int)
+    limit = request.args.get('limit', HISTORY_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, HISTORY_PAGE_SIZE))
+    items, start, oldest = get_history_page(lead_id, before=before, limit=limit)
+    return jsonify({"items": items, "start": start, "oldest": oldest})
 
 @app.route('/send_message', methods=['POST'])
 def send_message():
@@ -137,33 +282,31 @@ def send_message():
     if not user_text: return jsonify({"error": "Empty message received."}), 400
 
     # Append user message to server-side history
-    with history_lock:
-        if lead_id not in chat_histories: chat_histories[lead_id] = [] # Initialize if missing
-        chat_histories[lead_id].append({"author": "User", "text": user_text})
+    append_history(lead_id, {"author": "User", "text": user_text})
 
 
-    try:
-        user_content = genai_types.Content(role='user', parts=[genai_types.Part(text=user_text)])
-        app.logger.info(f"Running turn for {lead_id} with message: '{user_text}'")
-        events = runner_main.run(user_id=WEB_USER_ID, session_id=lead_id, new_message=user_content)
+    user_content = genai_types.Content(role='user', parts=[genai_types.Part(text=user_text)])
 
+    # Stream each agent message as one JSON line (NDJSON) as soon as its event arrives
+    def generate():
         agent_responses = []
-        with history_lock: # Lock while potentially modifying history
-             if lead_id not in chat_histories: chat_histories[lead_id] = [] # Safety check
-             for event in events:
-                 if event.content and event.content.parts:
-                     response_text = event.content.parts[0].text
-                     response_obj = {"author": "Agent", "text": response_text}
-                     agent_responses.append(response_obj)
-                     # Append agent response to server-side history
-                     chat_histories[lead_id].append(response_obj)
-
-        app.logger.info(f"Agent responses for {lead_id}: {agent_responses}")
-        return jsonify({"responses": agent_responses})
-
-    except Exception as e:
-        app.logger.error(f"Error running agent turn for {lead_id}: {e}", exc_info=True)
-        return jsonify({"error": f"Error processing message: {e}"}), 500
+        try:
+            app.logger.info("Running turn for %s with message: '%s'", lead_id, user_text)
+            for event in runner_main.run(user_id=WEB_USER_ID, session_id=lead_id, new_message=user_content):
+                if event.content and event.content.parts:
+                    response_obj = {"author": "Agent", "text": event.content.parts[0].text}
+                    agent_responses.append(response_obj)
+                    yield app.json.dumps(response_obj) + "\n"
+        except Exception as e:
+            # Headers are already sent, so the error goes out as a final line
+            app.logger.error("Error running agent turn for %s: %s", lead_id, e, exc_info=True)
+            yield app.json.dumps({"error": f"Error processing message: {e}"}) + "\n"
+        finally:
+            # Append the turn's agent responses to server-side history in one go (also if the client disconnects)
+            append_history(lead_id, *agent_responses)
+            app.logger.info("Sent %s agent responses for %s", len(agent_responses), lead_id)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 # --- Run Flask App ---
 if __name__ == '__main__':
@@ -0,0 +1,18 @@
+# gunicorn.conf.py
+# Production server settings, picked up automatically by: gunicorn app:app
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "127.0.0.1:8000")
+
+# ADK sessions (InMemorySessionService) and the lead store's index live in process memory,
+# so one worker is the safe default; raise it only with shared session/lead storage.
+workers = int(os.environ.get("GUNICORN_WORKERS", 1))
+
+# Threaded workers rather than gevent: Runner.run drives the agent on its own thread and
+# asyncio loop, and the lead store runs a writer thread, neither of which should be monkey-patched.
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 2 * multiprocessing.cpu_count() + 1))
+
+timeout = 120 # Agent turns can be slow; don't kill a worker mid-turn
+accesslog = "-"
@@ -5,8 +5,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const chatTranscript = document.getElementById('chat-transcript');
     const errorMessageDiv = document.getElementById('error-message');
 
-    // Function to add a message to the transcript DIV
-    function addMessageToTranscript(author, text) {
+    // Builds the DIV for one message
+    function createMessageElement(author, text) {
         const messageDiv = document.createElement('div');
         messageDiv.classList.add('message', author.toLowerCase()); // agent or user
 
@@ -21,7 +21,12 @@ document.addEventListener('DOMContentLoaded', () => {
 
         messageDiv.appendChild(authorSpan);
         messageDiv.appendChild(textSpan);
-        chatTranscript.appendChild(messageDiv);
+        return messageDiv;
+    }
+
+    // Function to add a message to the transcript DIV
+    function addMessageToTranscript(author, text) {
+        chatTranscript.appendChild(createMessageElement(author, text));
 
         // Scroll to the bottom smoothly after adding a message
         chatTranscript.scrollTo({ top: chatTranscript.scrollHeight, behavior: 'smooth' });
@@ -66,15 +71,29 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error(errorMsg);
             }
 
-            // Parse the JSON response from the server
-            const data = await response.json();
+            // The server streams one JSON object per line (NDJSON); show each agent message as it arrives
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffered = '';
+            let responseCount = 0;
+            const handleLine = (line) => {
+                if (!line.trim()) return;
+                const msg = JSON.parse(line);
+                if (msg.error) throw new Error(msg.error);
+                addMessageToTranscript(msg.author, msg.text);
+                responseCount++;
+            };
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffered += decoder.decode(value, { stream: true });
+                const lines = buffered.split('\n');
+                buffered = lines.pop(); // Keep any partial line for the next chunk
+                lines.forEach(handleLine);
+            }
+            handleLine(buffered + decoder.decode());
 
-            // Display agent response(s) received from the backend
-            if (data.responses && data.responses.length > 0) {
-                data.responses.forEach(msg => {
-                    addMessageToTranscript(msg.author, msg.text);
-                });
-            } else {
+            if (responseCount === 0) {
                 // Log if agent provided no specific message response this turn
                 console.log("Agent provided no message response this turn.");
                 // Optionally, add a system message to the transcript
@@ -96,12 +115,50 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
-     // --- Ensures transcript is scrolled to bottom on initial page load ---
-     // Needs to run slightly after initial rendering allows scroll height calculation
-     setTimeout(() => {
-        chatTranscript.scrollTop = chatTranscript.scrollHeight;
-     }, 100); // Small delay
+     // --- Chat history: latest page on load, older pages when scrolled to the top ---
+     let oldestLoadedIndex = null; // Server position of the first message shown
+     let historyExhausted = false; // Nothing older is kept on the server
+     let loadingHistory = false;
+
+     async function loadHistoryPage() {
+        if (loadingHistory || historyExhausted) return;
+        loadingHistory = true;
+        const isFirstPage = oldestLoadedIndex === null;
+        try {
+            const query = isFirstPage ? '' : `?before=${oldestLoadedIndex}`;
+            const response = await fetch(`/history${query}`);
+            if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+            const data = await response.json();
+
+            const previousHeight = chatTranscript.scrollHeight;
+            const fragment = document.createDocumentFragment();
+            data.items.forEach(msg => fragment.appendChild(createMessageElement(msg.author, msg.text)));
+            chatTranscript.insertBefore(fragment, chatTranscript.firstChild);
+            oldestLoadedIndex = data.start;
+            historyExhausted = data.start <= data.oldest;
+
+            if (isFirstPage) {
+                chatTranscript.scrollTop = chatTranscript.scrollHeight;
+            } else {
+                // Keep the messages the user was looking at in place
+                chatTranscript.scrollTop += chatTranscript.scrollHeight - previousHeight;
+            }
+        } catch (error) {
+            console.error('Error loading chat history:', error);
+            errorMessageDiv.textContent = `Error loading history: ${error.message}`;
+        } finally {
+            loadingHistory = false;
+            if (isFirstPage) {
+                // Only now, so a reply streamed in can't land above the history being prepended
+                messageInput.disabled = false;
+                messageInput.focus();
+            }
+        }
+     }
 
-     // Focus the input field when the page loads
-     messageInput.focus();
+     chatTranscript.addEventListener('scroll', () => {
+        if (chatTranscript.scrollTop === 0) loadHistoryPage();
+     });
+     messageInput.disabled = true; // Until the first history page is shown
+     loadHistoryPage();
 });
\ No newline at end of file